@@ -1,20 +1,51 @@
 import json
+import os
 import time
 from datetime import datetime, timedelta
 
 import requests
-from PyQt5.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, pyqtSignal
+from PyQt5 import sip
+from PyQt5.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, pyqtSignal, QObject, QThread, \
+    QCoreApplication
 from PyQt5.QtWidgets import QHBoxLayout, QLabel, QScrollArea, QWidget, QVBoxLayout, QScrollBar
 from loguru import logger
 from qfluentwidgets import isDarkTheme
 
 from .ClassWidgets.base import PluginConfig, PluginBase
 
+try:
+    import orjson  # 更快的 JSON 解析
+except ImportError:
+    orjson = None
+
 WIDGET_CODE = 'ScoreRate_Analyzer_widget.ui'
 WIDGET_NAME = '作业得分率分析 | LaoShui'
 WIDGET_WIDTH = 245
 
 CACHE_DURATION = 1800  # 缓存更新周期：30分钟
+REQUEST_TIMEOUT = 15  # 网络请求超时时间：15秒
+
+# 内容标签样式，按是否深色主题预先生成
+LABEL_STYLE = {
+    dark_theme: f"""
+        font-size: 20px;
+        color: {"#FFFFFF" if dark_theme else "#000000"};
+        padding: 10px;
+        font-weight: bold;
+        background: none;
+    """
+    for dark_theme in (True, False)
+}
+
+
+def json_loads(data):
+    """解析 JSON，优先使用 orjson"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def json_dumps(data):
+    """序列化为 JSON 字节串，优先使用 orjson"""
+    return orjson.dumps(data) if orjson else json.dumps(data).encode('utf-8')
 
 
 class SmoothScrollBar(QScrollBar):
@@ -31,6 +62,11 @@ class SmoothScrollBar(QScrollBar):
         self.__value = self.value()
         self.ani.finished.connect(self.scrollFinished)
 
+        # 自动滚动：单个循环动画代替逐帧定时器，每30毫秒滚动1像素
+        self.autoAni = QPropertyAnimation(self, b"value", self)
+        self.autoAni.setLoopCount(-1)
+        self.rangeChanged.connect(self.autoScroll)
+
     def setValue(self, value: int):
         if value == self.value():
             return
@@ -42,6 +78,17 @@ class SmoothScrollBar(QScrollBar):
         self.ani.setEndValue(value)
         self.ani.start()
 
+    def autoScroll(self, minimum, maximum):
+        """内容范围变化时重新开始自动滚动"""
+        self.autoAni.stop()
+        if maximum <= minimum:
+            return
+
+        self.autoAni.setStartValue(minimum)
+        self.autoAni.setEndValue(maximum)
+        self.autoAni.setDuration((maximum - minimum) * 30)
+        self.autoAni.start()
+
     def wheelEvent(self, e):
         e.ignore()  # 阻止默认滚轮事件
 
@@ -60,6 +107,24 @@ class SmoothScrollArea(QScrollArea):
             self.vScrollBar.scrollValue(-e.angleDelta().y())
 
 
+class FetchWorker(QObject):
+    """后台获取数据，避免网络请求阻塞界面"""
+    finished = pyqtSignal(str)
+
+    def __init__(self, fetch_func, fallback_func):
+        super().__init__()
+        self.fetch_func = fetch_func
+        self.fallback_func = fallback_func
+
+    def run(self):
+        try:
+            data = self.fetch_func()
+        except Exception as e:
+            logger.exception(f"后台获取数据失败: {e}")
+            data = self.fallback_func()
+        self.finished.emit(data)  # 无论成功与否都发出信号，确保线程退出
+
+
 class Plugin(PluginBase):
     def __init__(self, cw_contexts, method):
         super().__init__(cw_contexts, method)
@@ -71,75 +136,107 @@ class Plugin(PluginBase):
         self.cfg = PluginConfig(self.PATH, 'config.json')
         self.method.register_widget(WIDGET_CODE, WIDGET_NAME, WIDGET_WIDTH)
 
+        # 配置缓存，仅在文件修改后重新解析
+        self._config = None
+        self._config_mtime = 0
+        self._reload_config()
+
         self.headers = self.load_headers()
         self.previous_data = None  # 用于缓存历史数据
-
-        # 定时器配置
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_score_data)
-        self.timer.start(CACHE_DURATION * 1000)
-
-        # 滚动相关配置
-        self.scroll_position = 0
-        self.scroll_timer = QTimer()
-        self.scroll_timer.timeout.connect(self.auto_scroll)
-        self.scroll_timer.start(30)
-
-    def load_headers(self):
-        """加载认证头信息"""
+        self._last_hash = None  # 上次响应内容的哈希，数据未变化时跳过重新处理
+        self._encoding_logged = False
+
+        # 常驻的内容标签，刷新时只更新文字
+        self._content_label = None
+        self._content_widget = None  # 内容标签所在的小组件
+        self._last_text = None
+        self._dark_theme = None
+
+        # 后台获取线程
+        self._thread = None
+        self._worker = None
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)  # 退出前等待后台线程结束
+
+        # 复用同一会话，保持与服务器的长连接
+        self.http = requests.Session()
+        self.set_session_headers(self.headers)
+
+    def _reload_config(self):
+        """配置文件有变动时重新加载"""
         try:
-            with open(self.CONFIG_PATH, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                config['headers']['t'] = str(int(time.time()))  # 更新请求头中的t字段为当前时间戳
-                return config['headers']
+            st = os.stat(self.CONFIG_PATH)
+            if st.st_mtime != self._config_mtime:
+                with open(self.CONFIG_PATH, 'rb') as f:
+                    self._config = json_loads(f.read())
+                self._config_mtime = st.st_mtime
         except Exception as e:
             logger.error(f"加载配置文件失败: {e}")
+
+    def load_headers(self):
+        """加载认证头信息"""
+        self._reload_config()
+        headers = self._config.get('headers') if isinstance(self._config, dict) else None
+        if not isinstance(headers, dict):
+            logger.error("配置文件中的 headers 无效")
             return {}
+        return dict(headers, t=str(int(time.time())))  # 更新请求头中的t字段为当前时间戳
+
+    def set_session_headers(self, headers):
+        """重建会话请求头，使配置中删除的字段不再残留（保留默认的 Accept-Encoding 压缩设置）"""
+        session_headers = requests.utils.default_headers()
+        session_headers.update(headers)
+        self.http.headers = session_headers
 
     def load_params(self, start_date, end_date):
         """加载请求参数"""
-        try:
-            with open(self.CONFIG_PATH, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                params = config.get('params', {})
-                params['startDate'] = start_date
-                params['endDate'] = end_date
-                return params
-        except Exception as e:
-            logger.error(f"加载请求参数失败: {e}")
+        self._reload_config()
+        params = self._config.get('params') if isinstance(self._config, dict) else None
+        if not isinstance(params, dict):
+            logger.error("配置文件中的 params 无效")
             return {}
+        return {**params, 'startDate': start_date, 'endDate': end_date}
 
     def fetch_score_data(self):
         """获取得分率数据"""
         end_date = datetime.now()
         start_date = end_date - timedelta(days=7)
-        params = self.load_params(
-            start_date.strftime('%Y-%m-%d'),
-            end_date.strftime('%Y-%m-%d')
-        )
-        # params = self.load_params("2024-12-29", "2025-01-01")  # 调试用
 
         try:
+            params = self.load_params(
+                start_date.strftime('%Y-%m-%d'),
+                end_date.strftime('%Y-%m-%d')
+            )
+            # params = self.load_params("2024-12-29", "2025-01-01")  # 调试用
+            self.headers = self.load_headers()
+            self.set_session_headers(self.headers)
+
             # 第一阶段：GET获取作业ID数据
-            response_get = requests.get(
+            response_get = self.http.get(
                 'https://www.xinjiaoyu.com/api/v3/server_homework/homework/class/score/rate',
-                headers=self.headers,
-                params=params
+                params=params,
+                timeout=REQUEST_TIMEOUT
             )
-            if response_get.status_code != 200:
-                raise Exception(f'GET请求失败，状态码：{response_get.status_code}')
+            response_get.raise_for_status()
+            if not self._encoding_logged:
+                logger.info(f"响应压缩方式: {response_get.headers.get('Content-Encoding', '无')}")
+                self._encoding_logged = True
 
-            data = response_get.json()
+            data = json_loads(response_get.content)
             # print(data)
 
             if not data.get('data') or not data['data'].get('homeworkCourseVOList'):
                 raise Exception('数据为空或格式不正确')
 
             # 第二阶段：POST获取作业详细得分率数据
-            template_ids = [str(homework['templateId']) for course in data['data']['homeworkCourseVOList'] for homework
-                            in course['homeworkVOList'] if homework['templateId'] is not None]
-            homework_ids = [homework_id for course in data['data']['homeworkCourseVOList'] for homework in
-                            course['homeworkVOList'] for homework_id in homework['homeworkIds']]
+            template_ids, homework_ids = [], []
+            for course in data['data']['homeworkCourseVOList']:
+                for homework in course['homeworkVOList']:
+                    template_id = homework['templateId']
+                    if template_id is not None:
+                        template_ids.append(str(template_id))
+                    homework_ids.extend(homework['homeworkIds'])
             class_ids = [cls['classId'] for cls in data['data']['classVOList']]
 
             payload = {
@@ -152,20 +249,35 @@ class Plugin(PluginBase):
                 'classIds': class_ids
             }
 
-            response_post = requests.post(
+            response_post = self.http.post(
                 'https://www.xinjiaoyu.com/api/v3/server_homework/homework/answer/sheet/class/score/rate',
-                headers=self.headers,
-                json=payload
+                data=json_dumps(payload),
+                headers={'Content-Type': 'application/json'},
+                timeout=REQUEST_TIMEOUT
             )
-            if response_post.status_code != 200:
-                raise Exception(f'POST请求失败，状态码：{response_post.status_code}')
+            response_post.raise_for_status()
             # print(response_post.json())
 
-            return self.process_data(response_post.json())
+            content_hash = hash(response_post.content)
+            if content_hash == self._last_hash and self.previous_data:
+                self.previous_data = self.refresh_update_time(self.previous_data)
+                return self.previous_data
+
+            content = self.process_data(json_loads(response_post.content))
+            self._last_hash = content_hash
+            return content
 
+        except requests.RequestException as e:
+            logger.error(f"网络请求失败: {e}")
+        except ValueError as e:
+            logger.error(f"响应数据解析失败: {e}")
         except Exception as e:
             logger.error(f"数据获取失败: {e}")
-            return self.previous_data if self.previous_data else f"更新时间: {datetime.now().strftime('%H:%M:%S')}\n暂无可用数据"
+        return self.fallback_content()
+
+    def fallback_content(self):
+        """获取失败时显示的内容"""
+        return self.previous_data if self.previous_data else f"更新时间: {time.strftime('%H:%M:%S')}\n暂无可用数据"
 
     def process_data(self, post_data):
         """处理并格式化数据"""
@@ -174,53 +286,81 @@ class Plugin(PluginBase):
         course_mapping = {course["courseId"]: course["courseName"] for course in course_list}
 
         content = []
-
-        def get_rate(course_score_rate_list, target_course_id):
-            for item in course_score_rate_list:
-                if item.get("courseId") == target_course_id:
-                    return item.get("scoreRate")
-            return None
-
-        # 处理全年级数据（classId 为 "-1"）- 全科和单科
-        grade_data = next((item for item in post_data['data']['scoreRateVOList'] if item['classId'] == "-1"), None)
+        fmt = self.format_rate
+
+        # 一次遍历区分全年级数据（classId 为 "-1"）与班级数据
+        grade_data = None
+        classes = []
+        for item in post_data['data']['scoreRateVOList']:
+            if item['classId'] != "-1":
+                classes.append(item)
+            elif grade_data is None:
+                grade_data = item
+
+        # 处理全年级数据 - 全科和单科
         if grade_data:
-            content.append(f"数据更新时间: {datetime.now().strftime('%H:%M:%S')}")
+            content.append(f"数据更新时间: {time.strftime('%H:%M:%S')}")
             content.append("近七天年级段作业得分率数据\n【全年级】")
-            full_rate = get_rate(grade_data['courseScoreRate'], "-1")
-            content.append(f"全科得分率：{self.format_rate(full_rate)}")
+            rates = {course['courseId']: course['scoreRate'] for course in grade_data['courseScoreRate']}
+            full_rate = rates.pop("-1", None)
+            content.append(f"全科得分率：{fmt(full_rate)}")
             content.append("单科得分率：")
-            for course in grade_data['courseScoreRate']:
-                if course['courseId'] == "-1":
-                    continue
-                name = course_mapping.get(course['courseId'], "未知科目")
-                content.append(f"{name}：{self.format_rate(course['scoreRate'])}")
+            content.extend(
+                f"{course_mapping.get(course_id, '未知科目')}：{fmt(score_rate)}" for course_id, score_rate in rates.items()
+            )
 
         # 处理班级数据
         content.append("\n【各班级】")
-        for class_data in post_data['data']['scoreRateVOList']:
-            if class_data['classId'] == "-1":
-                continue
+        for class_data in classes:
             content.append(f"\n班级：{class_data['className']}")
-            full_rate = get_rate(class_data['courseScoreRate'], "-1")
-            content.append(f"全科得分率：{self.format_rate(full_rate)}")
+            rates = {course['courseId']: course['scoreRate'] for course in class_data['courseScoreRate']}
+            full_rate = rates.pop("-1", None)
+            content.append(f"全科得分率：{fmt(full_rate)}")
             content.append("单科得分率：")
-            for course in class_data['courseScoreRate']:
-                if course['courseId'] == "-1":
-                    continue
-                name = course_mapping.get(course['courseId'], "未知科目")
-                content.append(f"  {name}：{self.format_rate(course['scoreRate'])}")
+            content.extend(
+                f"  {course_mapping.get(course_id, '未知科目')}：{fmt(score_rate)}" for course_id, score_rate in rates.items()
+            )
 
         self.previous_data = '\n'.join(content)
         return self.previous_data
 
+    @staticmethod
+    def refresh_update_time(content):
+        """仅替换缓存内容中的更新时间"""
+        head, sep, rest = content.partition('\n')
+        if head.startswith("数据更新时间: "):
+            return f"数据更新时间: {time.strftime('%H:%M:%S')}{sep}{rest}"
+        return content
+
     @staticmethod
     def format_rate(rate):
         """格式化得分率显示"""
         return f"{rate}%" if rate != "-" else rate
 
     def update_score_data(self):
-        """更新数据并刷新界面"""
-        data = self.fetch_score_data()
+        """在后台线程中获取数据"""
+        if self._fetch_running():
+            return  # 上一次获取尚未完成
+
+        self._thread = QThread()
+        self._worker = FetchWorker(self.fetch_score_data, self.fallback_content)
+        self._worker.moveToThread(self._thread)
+        self._thread.started.connect(self._worker.run)
+        self._worker.finished.connect(self._on_data_ready)
+        self._worker.finished.connect(self._thread.quit)
+        self._thread.finished.connect(self._worker.deleteLater)
+        self._thread.finished.connect(self._thread.deleteLater)
+        self._thread.start()
+
+    def _fetch_running(self):
+        """后台获取线程是否仍在运行"""
+        return self._thread is not None and not sip.isdeleted(self._thread) and self._thread.isRunning()
+
+    def _on_data_ready(self, data):
+        """数据获取完成后在主线程刷新界面"""
+        # 本次获取完成后再计划下一次，避免请求耗时造成周期漂移或重叠；先行计划以免界面更新出错中断刷新
+        QTimer.singleShot(CACHE_DURATION * 1000, self.update_score_data)
+
         self.update_widget_content(data)
         self.method.change_widget_content(WIDGET_CODE, WIDGET_NAME, WIDGET_NAME)
         logger.info("得分率数据已更新")
@@ -232,6 +372,16 @@ class Plugin(PluginBase):
             logger.error("小组件未找到")
             return
 
+        if (widget is self._content_widget and self._content_label is not None
+                and not sip.isdeleted(self._content_label)):
+            dark_theme = isDarkTheme()
+            if dark_theme != self._dark_theme:
+                self.apply_label_style(self._content_label, dark_theme)
+            if content != self._last_text:
+                self._content_label.setText(content)
+                self._last_text = content
+            return
+
         layout = self.find_child_layout(widget, 'contentLayout')
         if not layout:
             logger.error("布局未找到")
@@ -240,6 +390,7 @@ class Plugin(PluginBase):
         self.clear_existing_content(layout)
         scroll_area = self.create_scroll_area(content)
         layout.addWidget(scroll_area)
+        self._content_widget = widget
 
     def create_scroll_area(self, content):
         scroll_area = SmoothScrollArea()
@@ -248,24 +399,24 @@ class Plugin(PluginBase):
         scroll_content = QWidget()
         scroll_content_layout = QVBoxLayout()
         scroll_content.setLayout(scroll_content_layout)
-        self.clear_existing_content(scroll_content_layout)
 
-        font_color = "#FFFFFF" if isDarkTheme() else "#000000"
         content_label = QLabel(content)
         content_label.setAlignment(Qt.AlignLeft)  # 设置文字为左对齐
         content_label.setWordWrap(True)
-        content_label.setStyleSheet(f"""
-            font-size: 20px;
-            color: {font_color};
-            padding: 10px;
-            font-weight: bold;
-            background: none;
-        """)
+        self.apply_label_style(content_label, isDarkTheme())
         scroll_content_layout.addWidget(content_label)
 
         scroll_area.setWidget(scroll_content)
+
+        self._content_label = content_label
+        self._last_text = content
         return scroll_area
 
+    def apply_label_style(self, label, dark_theme):
+        """按主题设置标签样式"""
+        label.setStyleSheet(LABEL_STYLE[dark_theme])
+        self._dark_theme = dark_theme
+
     @staticmethod
     def find_child_layout(widget, name):
         """查找子布局"""
@@ -279,26 +430,17 @@ class Plugin(PluginBase):
             if widget := item.widget():
                 widget.deleteLater()
 
-    def auto_scroll(self):
-        """自动滚动功能"""
-        widget = self.method.get_widget(WIDGET_CODE)
-        if not widget:
-            return
-
-        scroll_area = widget.findChild(SmoothScrollArea)
-        if not scroll_area:
-            return
-
-        scrollbar = scroll_area.verticalScrollBar()
-        max_pos = scrollbar.maximum()
-
-        if self.scroll_position >= max_pos:
-            self.scroll_position = 0
-        else:
-            self.scroll_position += 1
-
-        scrollbar.setValue(self.scroll_position)
-
     def execute(self):
         """初始执行"""
         self.update_score_data()
+
+    def shutdown(self):
+        """等待后台线程结束后释放网络会话"""
+        if self._fetch_running():
+            self._thread.quit()
+            self._thread.wait()
+        self.http.close()
+
+    def __del__(self):
+        if getattr(self, 'http', None) is not None:
+            self.shutdown()